@@ -1,38 +1,72 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
 from fastapi import FastAPI
 import pandas as pd
-# Adicionar prepare_data_and_vectorize na importação
-from recommender import get_recommendations, evaluate_accuracy, calculate_overall_accuracy, prepare_data_and_vectorize
+from recommender import ContentRecommender
 
-app = FastAPI()
+RATINGS_CSV = "ratings.csv"
 
 # Carrega os dados
 items_df = pd.read_csv("items.csv")
 
-# Inicializa a "inteligência" do sistema (Gera a matriz TF-IDF) assim que o servidor liga
-# Isso garante que o sistema já saiba ler os mangás antes do primeiro usuário chegar
-prepare_data_and_vectorize(items_df)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Inicializa a "inteligência" do sistema (Gera a matriz TF-IDF) uma única vez, quando o servidor liga
+    # Isso garante que o sistema já saiba ler os mangás antes do primeiro usuário chegar
+    app.state.reco = ContentRecommender(items_df)
+    # Pool dedicado ao trabalho de CPU das recomendações, separado do threadpool padrão do FastAPI
+    app.state.pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+    yield
+    app.state.pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+async def run_blocking(func, *args):
+    """Executa uma função bloqueante no pool dedicado sem travar o event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app.state.pool, func, *args)
+
+@lru_cache(maxsize=1)
+def _read_ratings(mtime_ns: int) -> pd.DataFrame:
+    return pd.read_csv(
+        RATINGS_CSV,
+        engine="pyarrow",
+        usecols=["user_id", "item_id", "rating"],
+        dtype={"user_id": "int32", "item_id": "int32", "rating": "int8"}
+    )
+
+def load_ratings() -> pd.DataFrame:
+    """
+    Retorna as avaliações, relendo o CSV apenas quando o arquivo foi modificado (mtime).
+    O DataFrame é compartilhado entre requisições, portanto não deve ser alterado.
+    """
+    return _read_ratings(os.stat(RATINGS_CSV).st_mtime_ns)
 
 @app.get("/")
 def root():
     return {"message": "Manga Recommender API online (Content-Based)"}
 
 @app.get("/recomendar/{user_id}")
-def recomendar(user_id: int):
-    # Recarrega o arquivo de avaliações a cada chamada (para pegar novas notas)
-    ratings_df = pd.read_csv("ratings.csv")
-    recs = get_recommendations(user_id, items_df, ratings_df)
+async def recomendar(user_id: int):
+    # Usa o cache de avaliações (recarregado automaticamente quando chegam novas notas)
+    ratings_df = await run_blocking(load_ratings)
+    recs = await run_blocking(app.state.reco.get_recommendations, user_id, ratings_df)
     return {"user_id": user_id, "recommendations": recs}
 
 @app.get("/avaliar_acuracia/{user_id}")
-def avaliar_acuracia(user_id: int):
-    ratings_df = pd.read_csv("ratings.csv")
-    result = evaluate_accuracy(user_id, items_df, ratings_df)
+async def avaliar_acuracia(user_id: int):
+    ratings_df = await run_blocking(load_ratings)
+    result = await run_blocking(app.state.reco.evaluate_accuracy, user_id, ratings_df)
     if "message" in result:
         return {"message": result["message"]}
     return result
 
 @app.get("/avaliar_acuracia_geral")
-def avaliar_acuracia_geral():
-    ratings_df = pd.read_csv("ratings.csv")
-    result = calculate_overall_accuracy(items_df, ratings_df)
+async def avaliar_acuracia_geral():
+    ratings_df = await run_blocking(load_ratings)
+    result = await run_blocking(app.state.reco.calculate_overall_accuracy, ratings_df)
     return result
\ No newline at end of file
@@ -1,165 +1,102 @@
+import logging
+
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
-# Variáveis globais para armazenar a matriz e o mapa de índices
-tfidf_matrix = None
-item_indices_map = {}
+log = logging.getLogger(__name__)
 
-def prepare_data_and_vectorize(items_df: pd.DataFrame):
+def normalize_rows_inplace(mat) -> np.ndarray:
     """
-    Passo 1: Preparação dos Dados e Vetorização (TF-IDF).
-    Cria a matriz de inteligência usando todas as colunas de texto disponíveis.
+    Normaliza (L2) cada linha da matriz no próprio lugar e retorna as normas originais.
+    Aceita matriz densa (np.ndarray) ou esparsa (CSR), sem criar cópias da matriz.
     """
-    global tfidf_matrix, item_indices_map
-    
-    # 1. Garantir que as colunas opcionais existem para não quebrar o código
-    if 'tags' not in items_df.columns:
-        items_df['tags'] = ''
-    if 'synopsis' not in items_df.columns:
-        items_df['synopsis'] = ''
-
-    # 2. Limpeza de dados (Preencher vazios)
-    items_df['category'] = items_df['category'].fillna('')
-    items_df['author'] = items_df['author'].fillna('')
-    items_df['title'] = items_df['title'].fillna('')
-    items_df['year'] = items_df['year'].astype(str).fillna('')
-    items_df['tags'] = items_df['tags'].fillna('')
-    items_df['synopsis'] = items_df['synopsis'].fillna('')
-
-    # 3. Criação da "Sopa de Metadados" (Metadata Soup)
-    # Junta tudo numa string gigante para o algoritmo ler
-    items_df['metadata_soup'] = (
-        items_df['category'] + " " + 
-        items_df['author'] + " " + 
-        items_df['year'] + " " + 
-        items_df['title'] + " " + 
-        items_df['tags'] + " " + 
-        items_df['synopsis']
-    )
+    if sp.issparse(mat):
+        # Soma dos quadrados por linha direto nos valores não-nulos da CSR
+        row_ids = np.repeat(np.arange(mat.shape[0]), np.diff(mat.indptr))
+        sq = np.bincount(row_ids, weights=mat.data * mat.data, minlength=mat.shape[0])
+    else:
+        sq = np.einsum('ij,ij->i', mat, mat)
 
-    # 4. Vetorização
-    # stop_words='english' remove palavras comuns em inglês. 
-    # O ideal seria ter uma lista em PT, mas o TF-IDF já filtra palavras muito repetidas naturalmente.
-    tfidf = TfidfVectorizer()
-    tfidf_matrix = tfidf.fit_transform(items_df['metadata_soup'])
-    
-    # Mapa para encontrar o índice da matriz dado o ID do item
-    item_indices_map = pd.Series(items_df.index, index=items_df['item_id']).to_dict()
-    
-    return tfidf_matrix
+    norms = np.sqrt(sq)
+    safe_norms = np.where(norms == 0, 1e-9, norms)
+    if sp.issparse(mat):
+        mat.data /= np.repeat(safe_norms, np.diff(mat.indptr))
+    else:
+        np.divide(mat, safe_norms[:, None], out=mat)
+    return norms
 
-def build_user_profile(user_id: int, ratings_df: pd.DataFrame) -> np.ndarray:
+def prepare_data_and_vectorize(items_df: pd.DataFrame):
     """
-    Passo 2: Construção do Perfil do Utilizador (Vetor Médio).
+    Passo 1: Preparação dos Dados e Vetorização (TF-IDF).
+    Cria a matriz de inteligência usando todas as colunas de texto disponíveis.
     """
-    # Consideramos que o usuário "gosta" de itens com nota >= 3 para montar o perfil
-    user_likes = ratings_df[(ratings_df['user_id'] == user_id) & (ratings_df['rating'] >= 3)]
-    
-    if user_likes.empty:
-        return None
+    # 1. Colunas de texto usadas (as opcionais, como tags e sinopse, viram texto vazio se não
+    # existirem) e limpeza de dados numa cópia local, sem alterar o DataFrame recebido
+    text_columns = ['category', 'author', 'year', 'title', 'tags', 'synopsis']
+    texts = items_df.reindex(columns=text_columns).fillna('').astype(str)
 
-    liked_indices = []
-    for item_id in user_likes['item_id']:
-        if item_id in item_indices_map:
-            liked_indices.append(item_indices_map[item_id])
-            
-    if not liked_indices:
-        return None
+    # 2. Criação da "Sopa de Metadados" (Metadata Soup)
+    # Junta tudo numa string gigante para o algoritmo ler (uma única concatenação vetorizada)
+    metadata_soup = texts['category'].str.cat([texts[col] for col in text_columns[1:]], sep=" ")
 
-    # Calcula o vetor médio (o "gosto médio" do usuário)
-    user_profile = np.mean(tfidf_matrix[liked_indices], axis=0)
-    return np.asarray(user_profile)
+    # 3. Vetorização
+    # N-gramas de caracteres (3 a 5, respeitando limites de palavra) em vez de palavras inteiras:
+    # não dependem de lista de stop words (que não temos em PT) e aproximam variações como
+    # "Ninja"/"Ninjas". min_df/max_df descartam n-gramas de um único mangá ou presentes em quase todos.
+    # dtype float32: os valores do TF-IDF ficam em [0, 1], então precisão simples não muda o
+    # ranking e lê metade dos bytes do float64 padrão a cada produto com a matriz
+    tfidf = TfidfVectorizer(
+        analyzer='char_wb',
+        ngram_range=(3, 5),
+        sublinear_tf=True,
+        min_df=2,
+        max_df=0.95,
+        dtype=np.float32
+    )
+    return tfidf.fit_transform(metadata_soup).tocsr()
 
-def get_recommendations(user_id: int, items_df: pd.DataFrame, ratings_df: pd.DataFrame, top_n: int = 5) -> list:
+def top_n_indices(scores: np.ndarray, top_n: int) -> np.ndarray:
     """
-    Passo 3: Geração de Recomendações (Similaridade de Cosseno).
+    Índices dos top_n maiores scores, em ordem decrescente, ignorando os -inf (já vistos).
+    Usa seleção parcial (argpartition) em vez de ordenar o vetor inteiro; empates são
+    resolvidos pela menor posição, como numa ordenação estável.
     """
-    if tfidf_matrix is None:
-        prepare_data_and_vectorize(items_df)
+    if top_n <= 0:
+        return np.empty(0, dtype=np.intp)
 
-    user_profile = build_user_profile(user_id, ratings_df)
-    
-    if user_profile is None:
-        return []
+    if top_n < len(scores):
+        # Valor do top_n-ésimo maior score; todos os empatados com ele entram como candidatos
+        kth_score = scores[np.argpartition(-scores, top_n - 1)[top_n - 1]]
+        candidates = np.flatnonzero(scores >= kth_score)
+    else:
+        candidates = np.arange(len(scores))
 
-    # Calcula similaridade entre o Perfil e TODOS os itens
-    cosine_sim = cosine_similarity(user_profile, tfidf_matrix)
-    
-    # Pega os scores
-    sim_scores = list(enumerate(cosine_sim[0]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    
-    # Filtra o que já foi visto
-    watched_items = set(ratings_df[ratings_df['user_id'] == user_id]['item_id'])
-    
-    recommendations = []
-    for idx, score in sim_scores:
-        real_item_id = items_df.iloc[idx]['item_id']
-        
-        if real_item_id not in watched_items:
-            row = items_df.iloc[idx]
-            recommendations.append({
-                "item_id": int(real_item_id),
-                "title": row['title'],
-                "category": row['category'],
-                "score": float(score)
-            })
-            
-        if len(recommendations) >= top_n:
-            break
-            
-    return recommendations
+    candidates = candidates[np.isfinite(scores[candidates])]
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order[:top_n]]
 
-def evaluate_accuracy(user_id: int, items_df: pd.DataFrame, ratings_df: pd.DataFrame) -> dict:
+def split_train_test(user_ratings: pd.DataFrame):
     """
-    Avaliação ajustada ("Agressiva") para garantir métricas visíveis em datasets pequenos.
-    - Top N = 30
-    - Nota de corte = 3
-    - Divisão 50/50
+    Divisão 50/50 das avaliações de um usuário (deixa bastante dado no teste).
+    Retorna (train_items, test_items).
+    Sorteia as posições com uma única permutação (mesma semente e mesmo sorteio de
+    DataFrame.sample), sem o alinhamento de índices do sample + drop.
     """
-    if tfidf_matrix is None:
-        prepare_data_and_vectorize(items_df)
-
-    user_ratings = ratings_df[ratings_df['user_id'] == user_id]
-    
-    # Régua de corte (Consideramos >= 3 como relevante para o teste)
-    threshold = 3
-    positives = user_ratings[user_ratings['rating'] >= threshold]
-    
-    if len(positives) < 2:
-        return {"user_id": user_id, "message": f"Utilizador tem poucas avaliações (>={threshold}) para dividir em treino/teste."}
-
-    # Divisão 50/50 para deixar bastante dado no teste (mais chances de acerto)
-    test_items = user_ratings.sample(frac=0.5, random_state=42)
-    train_items = user_ratings.drop(test_items.index)
-    
-    # Treino = Todo o resto do mundo + Metade do usuário
-    train_df = pd.concat([ratings_df[ratings_df['user_id'] != user_id], train_items])
-
-    # Geramos 30 recomendações (Pesca de arrasto)
-    recs = get_recommendations(user_id, items_df, train_df, top_n=30)
-    
-    recommended_ids = {r['item_id'] for r in recs}
-    
-    # Gabarito: O que estava no teste e era bom
-    relevant_items = set(test_items[test_items['rating'] >= threshold]['item_id'])
-    
-    if not relevant_items:
-         return {"user_id": user_id, "message": "Não sobraram itens relevantes no conjunto de teste."}
+    n = len(user_ratings)
+    test_positions = np.random.RandomState(42).permutation(n)[:round(0.5 * n)]
+    is_test = np.zeros(n, dtype=bool)
+    is_test[test_positions] = True
+    return user_ratings[~is_test], user_ratings.iloc[test_positions]
 
+def compute_metrics(recommended_ids: set, relevant_items: set) -> dict:
+    """
+    Calcula Precision, Recall e F1 a partir dos itens recomendados e do gabarito.
+    """
     # Acertos
     hits = len(recommended_ids & relevant_items)
-    
-    # Debug no Terminal
-    print(f"\n--- [DEBUG] Avaliação Usuário {user_id} ---")
-    print(f"Gabarito (Esperado): {relevant_items}")
-    print(f"Sistema Recomendou (IDs): {list(recommended_ids)[:10]}... (+20)")
-    print(f"Acertos: {hits}")
-    print("-------------------------------------------")
-
-    # Cálculo das Métricas
+
     # Precision: De tudo que recomendei, quanto eu acertei?
     precision = hits / len(recommended_ids) if len(recommended_ids) > 0 else 0.0
     
@@ -171,43 +108,222 @@ def evaluate_accuracy(user_id: int, items_df: pd.DataFrame, ratings_df: pd.DataF
         f1_score = 2 * (precision * recall) / (precision + recall)
     else:
         f1_score = 0.0
-        
+
     return {
-        "user_id": user_id,
         "precision": round(precision, 4),
         "recall": round(recall, 4),
         "f1_score": round(f1_score, 4),
-        "hits": hits,
-        "recommended": list(recommended_ids),
-        "relevant_in_test": list(relevant_items)
+        "hits": hits
     }
 
-def calculate_overall_accuracy(items_df: pd.DataFrame, ratings_df: pd.DataFrame) -> dict:
+class ContentRecommender:
     """
-    Calcula a média geral das métricas para todos os usuários.
+    Recomendador baseado em conteúdo.
+    Guarda a matriz TF-IDF do catálogo e os artefatos derivados (normas, IDs, índice item_id -> linha),
+    calculados uma única vez, para que as requisições reutilizem o mesmo estado sem variáveis globais.
     """
-    if tfidf_matrix is None:
-        prepare_data_and_vectorize(items_df)
+
+    def __init__(self, items_df: pd.DataFrame):
+        self.items_df = items_df
+        self.tfidf_matrix = prepare_data_and_vectorize(items_df)
+
+        # Garante linhas com norma unitária (cosseno vira produto escalar) e guarda as normas,
+        # calculadas uma única vez para reaproveitar nas requisições
+        self.item_norms = normalize_rows_inplace(self.tfidf_matrix)
+
+        # IDs na ordem das linhas da matriz e índice para encontrar a linha dado o ID (via get_indexer)
+        self.item_ids = items_df['item_id'].to_numpy()
+        self.item_id_index = pd.Index(self.item_ids)
+
+    def item_rows_for(self, ids) -> np.ndarray:
+        """
+        Converte IDs de itens nas linhas correspondentes da matriz, descartando IDs fora do catálogo.
+        """
+        rows = self.item_id_index.get_indexer(np.asarray(ids))
+        return rows[rows != -1]
+
+    def build_user_profile(self, user_id: int, ratings_df: pd.DataFrame) -> np.ndarray:
+        """
+        Passo 2: Construção do Perfil do Utilizador (Vetor Médio).
+        """
+        # Consideramos que o usuário "gosta" de itens com nota >= 3 para montar o perfil
+        user_likes = ratings_df[(ratings_df['user_id'] == user_id) & (ratings_df['rating'] >= 3)]
+    
+        if user_likes.empty:
+            return None
+
+        # Converte os IDs curtidos em linhas da matriz de uma vez
+        liked_indices = self.item_rows_for(user_likes['item_id'])
+            
+        if liked_indices.size == 0:
+            return None
+
+        # Calcula o vetor médio (o "gosto médio" do usuário) direto nos arrays da CSR: junta os
+        # não-nulos das k linhas curtidas e soma por termo com um único bincount, sem montar
+        # submatriz esparsa (o usuário típico curte poucos itens, e aí isso é bem mais leve)
+        matrix = self.tfidf_matrix
+        starts = matrix.indptr[liked_indices]
+        lengths = matrix.indptr[liked_indices + 1] - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        sums = np.bincount(matrix.indices[positions], weights=matrix.data[positions], minlength=matrix.shape[1])
+        return (sums / liked_indices.size).astype(matrix.dtype)
+
+    def get_recommendations(self, user_id: int, ratings_df: pd.DataFrame, top_n: int = 5) -> list:
+        """
+        Passo 3: Geração de Recomendações (Similaridade de Cosseno).
+        """
+        # Recorta as avaliações do usuário uma única vez (perfil e itens vistos usam o mesmo recorte)
+        user_ratings = ratings_df[ratings_df['user_id'] == user_id]
+        user_profile = self.build_user_profile(user_id, user_ratings)
+    
+        if user_profile is None:
+            return []
+
+        # Calcula similaridade entre o Perfil e TODOS os itens
+        # As linhas da matriz já têm norma unitária, então basta um produto matriz-vetor
+        # dividido pela norma do perfil (em vez de renormalizar tudo a cada chamada)
+        profile_norm = np.sqrt(np.vdot(user_profile, user_profile))
+        scores = (self.tfidf_matrix @ user_profile) / (profile_norm + 1e-12)
+    
+        # Filtra o que já foi visto: marca as linhas vistas direto no vetor de scores
+        scores[self.item_rows_for(user_ratings['item_id'])] = -np.inf
+    
+        # Seleciona só os top_n ainda não vistos, sem ordenar todos os scores
+        top_indices = top_n_indices(scores, top_n)
+    
+        # Busca as linhas escolhidas de uma vez só, sem montar uma Series por item
+        top_items = self.items_df.iloc[top_indices]
+        return [
+            {
+                "item_id": int(item_id),
+                "title": title,
+                "category": category,
+                "score": float(score)
+            }
+            for item_id, title, category, score in zip(
+                self.item_ids[top_indices],
+                top_items['title'].fillna(''),
+                top_items['category'].fillna(''),
+                scores[top_indices]
+            )
+        ]
+
+    def evaluate_accuracy(self, user_id: int, ratings_df: pd.DataFrame) -> dict:
+        """
+        Avaliação ajustada ("Agressiva") para garantir métricas visíveis em datasets pequenos.
+        - Top N = 30
+        - Nota de corte = 3
+        - Divisão 50/50
+        """
+        user_ratings = ratings_df[ratings_df['user_id'] == user_id]
+    
+        # Régua de corte (Consideramos >= 3 como relevante para o teste)
+        threshold = 3
+        positives = user_ratings[user_ratings['rating'] >= threshold]
+    
+        if len(positives) < 2:
+            return {"user_id": user_id, "message": f"Utilizador tem poucas avaliações (>={threshold}) para dividir em treino/teste."}
+
+        train_items, test_items = split_train_test(user_ratings)
+
+        # Geramos 30 recomendações (Pesca de arrasto)
+        # O perfil e os itens já vistos só dependem do próprio usuário, então basta a metade de
+        # treino dele (as avaliações dos outros usuários não mudam o resultado do Content-Based)
+        recs = self.get_recommendations(user_id, train_items, top_n=30)
+    
+        recommended_ids = {r['item_id'] for r in recs}
+    
+        # Gabarito: O que estava no teste e era bom
+        relevant_items = set(test_items[test_items['rating'] >= threshold]['item_id'])
+    
+        if not relevant_items:
+             return {"user_id": user_id, "message": "Não sobraram itens relevantes no conjunto de teste."}
+
+        metrics = compute_metrics(recommended_ids, relevant_items)
+    
+        # Debug no Terminal (só formata as mensagens se o nível DEBUG estiver ativo)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("--- Avaliação Usuário %s ---", user_id)
+            log.debug("Gabarito (Esperado): %s", relevant_items)
+            log.debug("Sistema Recomendou (IDs): %s... (+20)", list(recommended_ids)[:10])
+            log.debug("Acertos: %s", metrics['hits'])
         
-    unique_users = ratings_df["user_id"].unique()
-    metrics = {"precision": [], "recall": [], "f1_score": []}
-
-    count = 0
-    for user_id in unique_users:
-        result = evaluate_accuracy(user_id, items_df, ratings_df)
-        # Só conta se o cálculo foi bem sucedido (tem f1_score)
-        if "f1_score" in result:
+        return {
+            "user_id": user_id,
+            **metrics,
+            "recommended": list(recommended_ids),
+            "relevant_in_test": list(relevant_items)
+        }
+
+    def calculate_overall_accuracy(self, ratings_df: pd.DataFrame) -> dict:
+        """
+        Calcula a média geral das métricas para todos os usuários.
+        Usa as mesmas regras de evaluate_accuracy, mas monta os perfis de todos os usuários
+        numa matriz e pontua todos os itens com um único produto de matrizes.
+        """
+        threshold = 3
+        top_n = 30
+
+        # 1. Divisão treino/teste de cada usuário avaliável
+        liked_users = []  # pares (usuário, linha do item curtido no treino)
+        liked_rows = []
+        watched_users = []  # pares (usuário, linha de qualquer item avaliado no treino)
+        watched_rows = []
+        relevant_sets = []
+        # Agrupa as linhas por usuário numa única passada (user_id -> posições no DataFrame)
+        user_groups = ratings_df.groupby('user_id', sort=False).indices
+        for user_id, positions in user_groups.items():
+            user_ratings = ratings_df.take(positions)
+            if (user_ratings['rating'] >= threshold).sum() < 2:
+                continue
+
+            train_items, test_items = split_train_test(user_ratings)
+            relevant_items = set(test_items[test_items['rating'] >= threshold]['item_id'])
+            if not relevant_items:
+                continue
+
+            rows = self.item_rows_for(train_items.loc[train_items['rating'] >= threshold, 'item_id'])
+            liked_users.append(np.full(len(rows), len(relevant_sets)))
+            liked_rows.append(rows)
+            rows = self.item_rows_for(train_items['item_id'])
+            watched_users.append(np.full(len(rows), len(relevant_sets)))
+            watched_rows.append(rows)
+            relevant_sets.append(relevant_items)
+
+        if not relevant_sets:
+            return {"message": "Não foi possível calcular métricas para nenhum usuário (dados insuficientes)."}
+
+        # 2. Perfis de todos os usuários de uma vez: matriz de incidência (usuários x itens) com peso
+        # 1/k nos k itens curtidos de cada usuário; multiplicada pela TF-IDF dá o vetor médio de cada um
+        n_users = len(relevant_sets)
+        user_idx = np.concatenate(liked_users)
+        item_idx = np.concatenate(liked_rows)
+        liked_counts = np.bincount(user_idx, minlength=n_users)
+        weights = (1.0 / liked_counts[user_idx]).astype(self.tfidf_matrix.dtype)
+        incidence = sp.csr_matrix((weights, (user_idx, item_idx)), shape=(n_users, self.tfidf_matrix.shape[0]))
+        profiles = incidence @ self.tfidf_matrix
+
+        # 3. (itens x termos) @ (termos x usuários): um único produto no lugar de um por usuário.
+        # A norma do perfil não muda a ordem dentro de cada linha, então não é preciso dividir por ela.
+        scores = np.asarray(self.tfidf_matrix @ profiles.toarray().T).T
+        # Remove os itens já vistos de todos os usuários com uma única atribuição
+        scores[np.concatenate(watched_users), np.concatenate(watched_rows)] = -np.inf
+        # Sem perfil (nenhum item curtido no treino) = nenhuma recomendação
+        scores[liked_counts == 0] = -np.inf
+
+        # 4. Top 30 de cada usuário (mesma seleção de get_recommendations)
+        metrics = {"precision": [], "recall": [], "f1_score": []}
+        for i, relevant_items in enumerate(relevant_sets):
+            user_top = top_n_indices(scores[i], top_n)
+            result = compute_metrics(set(self.item_ids[user_top].tolist()), relevant_items)
             metrics["precision"].append(result["precision"])
             metrics["recall"].append(result["recall"])
             metrics["f1_score"].append(result["f1_score"])
-            count += 1
 
-    if count == 0:
-        return {"message": "Não foi possível calcular métricas para nenhum usuário (dados insuficientes)."}
-
-    return {
-        "mean_precision": sum(metrics["precision"]) / count,
-        "mean_recall": sum(metrics["recall"]) / count,
-        "mean_f1_score": sum(metrics["f1_score"]) / count,
-        "users_evaluated": count
-    }
\ No newline at end of file
+        count = len(relevant_sets)
+        return {
+            "mean_precision": sum(metrics["precision"]) / count,
+            "mean_recall": sum(metrics["recall"]) / count,
+            "mean_f1_score": sum(metrics["f1_score"]) / count,
+            "users_evaluated": count
+        }
\ No newline at end of file
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import requests
 import altair as alt
@@ -34,40 +35,66 @@ ITEMS_CSV = "../backend/items.csv"
 RATINGS_CSV = "../backend/ratings.csv"
 API_URL = "http://127.0.0.1:8000"
 
-@st.cache_data
-def load_data():
-    """Carrega os dados dos arquivos CSV, com cache para performance."""
+@st.cache_resource
+def load_items():
+    """Carrega o catálogo uma única vez (compartilhado entre re-renderizações, sem cópias)."""
     items = pd.read_csv(ITEMS_CSV)
     
     # Tratamento para garantir que a coluna tags exista e seja string (caso o CSV mude)
     if 'tags' not in items.columns:
         items['tags'] = ''
     items['tags'] = items['tags'].fillna('')
-    
-    if os.path.exists(RATINGS_CSV):
-        ratings = pd.read_csv(RATINGS_CSV)
-        for col in ["user_id", "item_id", "rating"]:
-            ratings[col] = pd.to_numeric(ratings[col], errors="coerce").fillna(0).astype(int)
-    else:
-        ratings = pd.DataFrame(columns=["user_id", "item_id", "rating"])
-    return items, ratings
+    return items
 
+@st.cache_data(max_entries=1)
+def load_ratings(mtime_ns):
+    """
+    Carrega as avaliações. O mtime do CSV faz parte da chave do cache, então qualquer
+    gravação no arquivo invalida só as avaliações (o catálogo continua em cache).
+    """
+    if mtime_ns is None:
+        return pd.DataFrame(columns=["user_id", "item_id", "rating"])
+
+    # Tipos definidos na leitura (notas de 1 a 5 cabem em int8) e parser pyarrow
+    return pd.read_csv(
+        RATINGS_CSV,
+        engine="pyarrow",
+        usecols=["user_id", "item_id", "rating"],
+        dtype={"user_id": "int32", "item_id": "int32", "rating": "int8"}
+    )
+
+def load_data():
+    """Carrega os dados dos arquivos CSV, com cache para performance."""
+    mtime_ns = os.stat(RATINGS_CSV).st_mtime_ns if os.path.exists(RATINGS_CSV) else None
+    return load_items(), load_ratings(mtime_ns)
+
+@st.cache_data(max_entries=1)
 def get_items_with_avg(items_df, ratings_df):
-    """Calcula a média de avaliação para cada item."""
+    """Calcula a média de avaliação para cada item, com cache entre as re-renderizações."""
+    items_with_avg = items_df.copy()
     if ratings_df.empty:
-        items_with_avg = items_df.copy()
         items_with_avg['avg_rating'] = 0
         return items_with_avg
-        
-    avg_ratings = ratings_df.groupby("item_id")["rating"].mean().reset_index()
-    items_with_avg = items_df.merge(avg_ratings, on="item_id", how="left").fillna(0)
-    items_with_avg.rename(columns={"rating": "avg_rating"}, inplace=True)
+
+    # Soma e contagem das notas por item_id numa única passada (sem groupby + merge)
+    rated_ids = ratings_df["item_id"].to_numpy()
+    size = max(rated_ids.max(), items_df["item_id"].max()) + 1
+    sums = np.bincount(rated_ids, weights=ratings_df["rating"].to_numpy(), minlength=size)
+    counts = np.bincount(rated_ids, minlength=size)
+    avg = np.divide(sums, counts, out=np.zeros(size), where=counts > 0)
+
+    items_with_avg['avg_rating'] = avg[items_df["item_id"].to_numpy()]
     return items_with_avg
 
 items_df, ratings_df = load_data()
 items_with_avg = get_items_with_avg(items_df, ratings_df)
 
 # --- Funções Auxiliares ---
+def append_rating(user_id, item_id, rating):
+    """Acrescenta uma única avaliação ao final do CSV, sem reescrever o arquivo inteiro."""
+    new_row = pd.DataFrame([{"user_id": user_id, "item_id": item_id, "rating": rating}])
+    new_row.to_csv(RATINGS_CSV, mode="a", header=not os.path.exists(RATINGS_CSV), index=False)
+
 def set_selected_manga_and_rerun(item_id):
     """Define o mangá selecionado e força a re-renderização para a página de detalhes."""
     st.session_state.selected_manga_id = item_id
@@ -98,10 +125,11 @@ def display_catalog():
         start_idx = (st.session_state.page - 1) * ITEMS_PER_PAGE
         paginated_items = filtered_items.iloc[start_idx : start_idx + ITEMS_PER_PAGE]
 
-        for i in range(0, len(paginated_items), 4):
+        # Converte a página para dicts uma única vez (evita montar uma Series por card)
+        records = paginated_items.to_dict('records')
+        for i in range(0, len(records), 4):
             cols = st.columns(4)
-            row_items = paginated_items.iloc[i:i+4]
-            for j, (_, row) in enumerate(row_items.iterrows()):
+            for j, row in enumerate(records[i:i+4]):
                 with cols[j]:
                     card(
                         title=f"{row['title']}",
@@ -144,16 +172,17 @@ def display_add_rating():
         ].index
 
         if not exists_index.empty:
+            # Nota alterada: o arquivo precisa ser regravado
             ratings_df.loc[exists_index, "rating"] = new_rating
+            ratings_df.to_csv(RATINGS_CSV, index=False)
             st.session_state.toast_message = {"message": "✅ Avaliação atualizada com sucesso!", "icon": "✅"}
         else:
+            # Nota nova: só acrescenta uma linha ao CSV (a cópia em memória serve para a tabela abaixo)
+            append_rating(new_user_id, new_item_id, new_rating)
             new_row = pd.DataFrame([{"user_id": new_user_id, "item_id": new_item_id, "rating": new_rating}])
             ratings_df = pd.concat([ratings_df, new_row], ignore_index=True)
             st.session_state.toast_message = {"message": "✅ Avaliação adicionada com sucesso!", "icon": "✅"}
 
-        ratings_df.to_csv(RATINGS_CSV, index=False)
-        st.cache_data.clear()
-
         # Mostra o aviso imediatamente
         st.toast(st.session_state.toast_message["message"], icon=st.session_state.toast_message["icon"])
         st.session_state.toast_message = None
@@ -311,14 +340,13 @@ def display_manga_details(item_id):
     if st.button("💾 Salvar Minha Avaliação"):
         if not user_rating_row.empty:
             ratings_df.loc[user_rating_row.index, "rating"] = new_rating
+            ratings_df.to_csv(RATINGS_CSV, index=False)
             st.session_state.toast_message = {"message": "✅ Avaliação atualizada!", "icon": "✅"}
         else:
-            new_row = pd.DataFrame([{"user_id": current_user_id, "item_id": item_id, "rating": new_rating}])
-            ratings_df = pd.concat([ratings_df, new_row], ignore_index=True)
+            # A página é recarregada logo em seguida (lendo o CSV novo), então basta acrescentar a linha
+            append_rating(current_user_id, item_id, new_rating)
             st.session_state.toast_message = {"message": "✅ Avaliação salva!", "icon": "✅"}
         
-        ratings_df.to_csv(RATINGS_CSV, index=False)
-        st.cache_data.clear()
         st.rerun()
 
 # --- Renderização Principal ---